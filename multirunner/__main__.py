@@ -1,14 +1,105 @@
 import argparse
 import atexit
+import hashlib
+import importlib.util
 import json
 import logging
+import marshal
 import os
 from .runner import JobRunner
-from .settings import ALWAYS_RAISE, RUNNER_HANDLERS, YAML_ENABLED
+from .settings import ALWAYS_RAISE, RUNNER_HANDLERS, YAML_ENABLED, DEFAULT_BATCH_SIZE
 import sys
+import tempfile
 import warnings
 
-def parse_args(argv=sys.argv[1:], default_loglvl=logging.INFO):
+SPEC_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'multirunner')
+
+def spec_cache_path(spec_file, raw):
+	spec_hash = hashlib.md5(raw).hexdigest()
+	name = '%s.%s.json' % (os.path.basename(spec_file), spec_hash)
+	return os.path.join(SPEC_CACHE_DIR, name)
+
+def load_spec_cache(path):
+	try:
+		with open(path) as f:
+			spec = json.load(f)
+	except ALWAYS_RAISE:
+		raise
+	except:
+		return None
+	return spec if isinstance(spec, dict) else None
+
+def precompile_code(spec):
+	'''
+	When the handler code is an inline string destined for workers running
+	this same interpreter, compile it once here and swap in a
+	content-hashed .pyc path, so n_procs workers load bytecode instead of
+	each re-parsing the source. Best-effort: on any failure the spec is
+	left alone and workers compile it themselves as before.
+	'''
+	if spec.get('exec_type') not in ('python', 'python3'):
+		return
+	if sys.version_info.major != 3:
+		return
+
+	exec_info = spec.get('exec_info')
+	if not isinstance(exec_info, dict):
+		return
+	code = exec_info.get('code')
+	if isinstance(code, dict):
+		if code.get('type') != 'string':
+			return
+		src = code.get('data')
+	else:
+		src = code
+	if not isinstance(src, str):
+		return
+
+	try:
+		code_obj = compile(src, '<handler>', 'exec')
+	except ALWAYS_RAISE:
+		raise
+	except:
+		# let the worker surface the syntax error through its own
+		# error-reporting path
+		return
+
+	try:
+		src_hash = hashlib.md5(src.encode('utf-8')).hexdigest()
+		name = 'handler.%s.%s.pyc' % (sys.implementation.cache_tag, src_hash)
+		pyc_path = os.path.join(SPEC_CACHE_DIR, name)
+		if not os.path.isfile(pyc_path):
+			header = importlib.util.MAGIC_NUMBER
+			header += b'\x00' * (12 if sys.version_info >= (3, 7) else 8)
+			os.makedirs(SPEC_CACHE_DIR, exist_ok=True)
+			fd, tmp = tempfile.mkstemp(dir=SPEC_CACHE_DIR, suffix='.pyc')
+			with os.fdopen(fd, 'wb') as f:
+				f.write(header)
+				f.write(marshal.dumps(code_obj))
+			os.replace(tmp, pyc_path)
+	except ALWAYS_RAISE:
+		raise
+	except:
+		return
+
+	exec_info['code'] = {'type': 'path', 'data': pyc_path}
+
+def save_spec_cache(path, spec):
+	# best-effort--a failed cache write should never fail the run
+	try:
+		os.makedirs(SPEC_CACHE_DIR, exist_ok=True)
+		fd, tmp = tempfile.mkstemp(dir=SPEC_CACHE_DIR, suffix='.json')
+		with os.fdopen(fd, 'w') as f:
+			json.dump(spec, f)
+		os.replace(tmp, path)
+	except ALWAYS_RAISE:
+		raise
+	except:
+		pass
+
+def parse_args(argv=None, default_loglvl=logging.INFO):
+	if argv is None:
+		argv = sys.argv[1:]
 	parser = argparse.ArgumentParser('MultiRunner')
 	parser.add_argument('-s', '--spec-file', type=str, default=None,
 		help='YAML file containing job specification. Optional--jobs can '
@@ -24,6 +115,10 @@ def parse_args(argv=sys.argv[1:], default_loglvl=logging.INFO):
 	parser.add_argument('-n', '--n-processes', type=int, default=os.cpu_count(),
 		help='Number of processes to spawn to process the input.')
 
+	parser.add_argument('-b', '--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+		help='Number of input records to keep in flight per process. '
+		'Larger batches amortize pipe latency for fast handlers.')
+
 	parser.add_argument('-o', '--output-file', type=str, default=sys.stdout,
 		help='Output file to write the results of the job to. Default is stdout')
 	parser.add_argument('--output-mode', type=str, default='w+',
@@ -64,7 +159,9 @@ def parse_args(argv=sys.argv[1:], default_loglvl=logging.INFO):
 
 	if isinstance(args.output_file, str):
 		try:
-			args.output_mode = args.output_mode.replace('b', '')
+			# results are forwarded from the workers as raw bytes, so the
+			# output file is always opened in binary mode
+			args.output_mode = args.output_mode.replace('b', '') + 'b'
 			stream = open(args.output_file, args.output_mode)
 		except BaseException as exc:
 			parser.error('Error when opening output stream: %s %s' % (exc.__class__.__name__, str(exc)))
@@ -109,29 +206,55 @@ def log_stats(runner, log):
 		log('Per-process average stats:\n%s', statstr)
 
 def load_spec(args, parser):
-	spec = {}
+	spec = None
 	if args.spec_file is not None:
-		if YAML_ENABLED:
-			import yaml
-			if args.spec_file.endswith('.json'):
-				loader = json.load
-			else:
-				loader = yaml.load
-		else:
-			warnings.warn('optional YAML dependency missing--spec must be JSON')
-			loader = json.load
-
 		try:
-			with open(args.spec_file) as f:
-				spec = loader(f)
-				assert isinstance(spec, dict)
-		except (yaml.reader.ReaderError, AssertionError) as exc:
-			parser.error('Error loading YAML spec. Spec must be a valid YAML object')
-			return
+			with open(args.spec_file, 'rb') as f:
+				raw = f.read()
 		except BaseException as exc:
 			parser.error('Error opening spec file: %s %s' % (exc.__class__.__name__, str(exc)))
 			return
 
+		use_yaml = not args.spec_file.endswith('.json')
+		if use_yaml and not YAML_ENABLED:
+			warnings.warn('optional YAML dependency missing--spec must be JSON')
+			use_yaml = False
+
+		cache_path = None
+		if use_yaml:
+			# YAML parsing dwarfs the rest of CLI startup; cache the parsed
+			# spec as JSON keyed by a hash of the file contents, so the YAML
+			# parser only runs when the spec actually changes
+			cache_path = spec_cache_path(args.spec_file, raw)
+			spec = load_spec_cache(cache_path)
+
+		if spec is None:
+			if use_yaml:
+				import yaml
+				try:
+					spec = yaml.safe_load(raw)
+					assert isinstance(spec, dict)
+				except (yaml.YAMLError, AssertionError) as exc:
+					parser.error('Error loading YAML spec. Spec must be a valid YAML object')
+					return
+				except BaseException as exc:
+					parser.error('Error opening spec file: %s %s' % (exc.__class__.__name__, str(exc)))
+					return
+				save_spec_cache(cache_path, spec)
+			else:
+				try:
+					spec = json.loads(raw.decode('utf-8'))
+					assert isinstance(spec, dict)
+				except AssertionError:
+					parser.error('Error loading spec. Spec must be a valid JSON object')
+					return
+				except BaseException as exc:
+					parser.error('Error opening spec file: %s %s' % (exc.__class__.__name__, str(exc)))
+					return
+
+	if spec is None:
+		spec = {}
+
 	if args.exec_type is not None:
 		spec['exec_type'] = args.exec_type
 
@@ -152,9 +275,11 @@ def load_spec(args, parser):
 		parser.error('Errors encountered when validating spec:\n%s' % '\n'.join(errs))
 		return
 
+	precompile_code(spec)
+
 	return spec
 
-def main(argv=sys.argv[1:]):
+def main(argv=None):
 	args, parser, logger = parse_args(argv)
 
 	spec = load_spec(args, parser)
@@ -162,10 +287,12 @@ def main(argv=sys.argv[1:]):
 		return 2
 
 	runner = JobRunner(
-		spec, args.data, 
+		spec, args.data,
 		n_procs=args.n_processes,
 		logger=logger,
-		process_timeout=args.timeout
+		process_timeout=args.timeout,
+		batch_size=args.batch_size,
+		binary=True
 	)
 
 	try:
@@ -178,12 +305,16 @@ def main(argv=sys.argv[1:]):
 		parser.error('Error encountered when %s: \n%s' % (err['when'], err['stack']))
 		return 2
 
+	out = args.output_file
+	out = getattr(out, 'buffer', out)
+	# every line the runner yields is already newline-terminated (see
+	# JobRunner.handle_stream), so the hot loop is a single buffered write
+	write = out.write
+
 	try:
 		with runner.run() as gen:
 			for item in gen:
-				if not item.endswith('\n'):
-					item += '\n'
-				args.output_file.write(item)
+				write(item)
 	except ALWAYS_RAISE as exc:
 		logger.info('Exiting w/ %s' % exc.__class__.__name__)
 		return 1
@@ -164,16 +164,18 @@ function validateSpec(spec) {
 	}}
 
 function handleItem(handler, item, context) {
-	let oc = new OutputCapture(), 
-		code = 0;
+	let oc = new OutputCapture(),
+		code = 0,
+		parsed = false;
 
 	oc.start();
 	try {
 		try {
 			arg = JSON.parse(item);
+			parsed = true;
 			code = handler(arg, context);
 			code = parseInt(code);
-			if (!isFinite(code)) 
+			if (!isFinite(code))
 				code = 0;
 		} catch (exc) {
 			console.error(exc.stack);
@@ -183,12 +185,23 @@ function handleItem(handler, item, context) {
 		oc.stop();
 	}
 
-	return {
-		data: item,
+	let val = {
 		exit: code,
 		stdout: oc.stdout,
 		stderr: oc.stderr
 	};
+
+	if (!parsed) {
+		// input wasn't valid JSON--echo it back as a plain string
+		val.data = item;
+		return sortedJSON(val);
+	}
+
+	// the input is known-valid JSON, so splice it into the envelope
+	// verbatim rather than re-encoding it as an escaped string--same
+	// contract as the python handler
+	let body = sortedJSON(val);
+	return '{"data":' + item.trim() + ',' + body.slice(1);
 }
 
 function main(argv) {
@@ -214,8 +227,7 @@ function main(argv) {
 			if (handler == null) {
 				throw Error('Null Handler!');
 			}
-			val = handleItem(handler, line);
-			console.log(sortedJSON(val));
+			console.log(handleItem(handler, line));
 		}
 	});
 }
@@ -1,5 +1,10 @@
 from __future__ import print_function
 
+# NOTE: this handler is deliberately standalone--it runs inside worker
+# interpreters (possibly python2) that don't have the multirunner
+# package importable, so the few helpers it shares with the package
+# (json encoding, ALWAYS_RAISE) are redefined here rather than imported.
+
 import argparse
 import fileinput
 try:
@@ -15,8 +20,27 @@ import sys
 import tempfile
 import traceback
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 ALWAYS_RAISE = (KeyboardInterrupt, SystemExit)
 
+if orjson is not None:
+    json_loads = orjson.loads
+
+    def json_dumpb(obj):
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+else:
+    json_loads = json.loads
+
+    def json_dumpb(obj):
+        return json.dumps(obj, sort_keys=True).encode('utf-8')
+
+def json_dumps(obj):
+    return json_dumpb(obj).decode('utf-8')
+
 class OutputCapture(object):
 
     def __init__(self, stdout=True, stderr=True):
@@ -38,14 +62,19 @@ class OutputCapture(object):
     def __enter__(self):
         for stream in ['stdout', 'stderr']:
             if self.capture[stream]:
-                setattr(sys, stream, self.streams[stream])
+                buf = self.streams[stream]
+                buf.seek(0)
+                buf.truncate()
+                setattr(sys, stream, buf)
         return self
 
     def __exit__(self, *args, **kwargs):
         for stream in ['stdout', 'stderr']:
             setattr(sys, stream, self.saves[stream])
 
-def get_handler(path, mod_name, handler):
+_module_cache = {}
+
+def load_module(path, mod_name):
     major, minor = sys.version_info[:2]
     if major == 2:
         import imp
@@ -59,6 +88,23 @@ def get_handler(path, mod_name, handler):
             spec = importlib.util.spec_from_file_location(mod_name, path)
             mod = importlib.util.module_from_spec(spec)
             spec.loader.exec_module(mod)
+    return mod
+
+def get_handler(path, mod_name, handler):
+    # re-executing the module per lookup is wasted work when the same
+    # handler file is loaded repeatedly in one process; key the cache on
+    # mtime+size so an edited file is picked up
+    try:
+        st = os.stat(path)
+        key = (path, mod_name, st.st_mtime, st.st_size)
+    except OSError:
+        key = None
+
+    mod = _module_cache.get(key) if key is not None else None
+    if mod is None:
+        mod = load_module(path, mod_name)
+        if key is not None:
+            _module_cache[key] = mod
 
     try:
         handler = getattr(mod, handler)
@@ -68,7 +114,7 @@ def get_handler(path, mod_name, handler):
 
 def validate_spec(spec):
     try:
-        execution_info = json.loads(spec)
+        execution_info = json_loads(spec)
     except ALWAYS_RAISE:
         raise
     except:
@@ -140,11 +186,17 @@ def validate_spec(spec):
             try: os.remove(path)
             except FileNotFoundError: pass
 
-def handle_item(handler, item, context_arg=True):
-    oc = OutputCapture()
+def handle_item(handler, item, context_arg=True, oc=None):
+    # capture buffers are reusable--callers processing many items should
+    # pass the same OutputCapture in rather than allocating one per item
+    if oc is None:
+        oc = OutputCapture()
+    parsed = False
+    error = None
     with oc:
         try:
-            args = json.loads(item),
+            args = json_loads(item),
+            parsed = True
             if context_arg:
                 args += {},
             code = handler(*args)
@@ -156,14 +208,24 @@ def handle_item(handler, item, context_arg=True):
             raise
         except:
             code = 1
-            traceback.print_exc()
+            if hasattr(traceback, 'TracebackException'):
+                # capture now, format once outside the capture context
+                # instead of printing through the swapped-out sys.stderr
+                error = traceback.TracebackException(*sys.exc_info())
+            else:
+                traceback.print_exc()
 
-    return {
-        'data': item,
+    val = {
         'exit': code,
         'stdout': oc.streams['stdout'].getvalue(),
         'stderr': oc.streams['stderr'].getvalue()
     }
+    if error is not None:
+        val['stderr'] += ''.join(error.format())
+    if not parsed:
+        # input wasn't valid JSON--echo it as a plain string as before
+        val['data'] = item
+    return val
 
 def iterate_stdin():
     '''
@@ -184,14 +246,57 @@ def main(in_data):
         sys.stdout.write('OK\n')
         sys.stdout.flush()
         # print('OK')
+        oc = OutputCapture()
+        stdout_fd = None
+        if hasattr(os, 'writev'):
+            try:
+                stdout_fd = sys.stdout.fileno()
+            except ALWAYS_RAISE:
+                raise
+            except:
+                stdout_fd = None
+        # bind the pump's hot names as locals--global/attribute loads per
+        # record add up when the handler itself is trivial
+        handle = handle_item
+        dumpb = json_dumpb
+        writev = os.writev if stdout_fd is not None else None
+        term = b'\n'
+        if writev is None:
+            # fallback must emit the line bytes unchanged: py2 stdout is
+            # already a byte stream, py3 exposes one as sys.stdout.buffer;
+            # decode+print would re-encode as ascii and die on UTF-8 input
+            out = sys.stdout if str is bytes else sys.stdout.buffer
+            out_write = out.write
+            out_flush = out.flush
+        # on python2 stdin lines are already utf-8 bytes; calling .encode
+        # on them would implicitly ascii-decode first and blow up on any
+        # non-ASCII record
+        needs_encode = str is not bytes
         for item in fin:
-            val = handle_item(data, item)
+            val = handle(data, item, oc=oc)
             if val is None:
                 break
-            print(json.dumps(val, sort_keys=True))
+            if 'data' in val:
+                line = dumpb(val)
+            else:
+                # the input is known-valid JSON (handle_item parsed it), so
+                # splice it into the envelope verbatim rather than paying to
+                # re-encode it as an escaped string
+                body = dumpb(val)
+                raw = item.strip()
+                if needs_encode:
+                    raw = raw.encode('utf-8')
+                line = b'{"data":' + raw + b',' + body[1:]
+            if writev is not None:
+                # payload and terminator in a single syscall, skipping the
+                # TextIOWrapper encode path entirely
+                writev(stdout_fd, [line, term])
+            else:
+                out_write(line + term)
+                out_flush()
     else:
         print('ERROR')
-        print(json.dumps(data, sort_keys=True))
+        print(json_dumps(data))
 
 if __name__ == '__main__':
     lines = iterate_stdin if sys.version_info.major == 2 else fileinput.input
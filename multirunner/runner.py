@@ -1,12 +1,13 @@
+from collections import deque
 from contextlib import contextmanager
-from itertools import chain
 import json
 import logging
 import os
-import select
+import selectors
 from .settings import (
 	RUNNER_COMMANDS, DEFAULT_MEMORY, DEFAULT_CPU,
-	ALWAYS_RAISE, RUNNER_HANDLERS, ANALYTICS_ENABLED
+	ALWAYS_RAISE, RUNNER_HANDLERS, ANALYTICS_ENABLED,
+	ORJSON_ENABLED, DEFAULT_BATCH_SIZE
 )
 import signal
 import subprocess
@@ -15,12 +16,38 @@ import threading
 import time
 import traceback
 from .utils import (
-	signal_handler, IterationCompleted, locked_attr_funcs, 
-	read_wait
+	signal_handler, IterationCompleted, locked_attr_funcs,
+	read_wait, drain_stream
 )
 
-def create_process(executable, spec, swap_sigint=True, universal_newlines=True, 
-				   stderr=None, read_timeout=30):
+# upper bound on the amount drained from a worker pipe per read() syscall
+PIPE_CHUNK = 65536
+
+if ORJSON_ENABLED:
+	import orjson
+
+	def json_dumps(obj):
+		return orjson.dumps(obj).decode('utf-8')
+else:
+	json_dumps = json.dumps
+
+if sys.platform.startswith('linux'):
+	import ctypes
+
+	_libc = ctypes.CDLL(None, use_errno=True)
+	_PR_SET_PDEATHSIG = 1
+
+	def _worker_preexec():
+		# make sure workers don't outlive a hard-killed dispatcher
+		try:
+			_libc.prctl(_PR_SET_PDEATHSIG, signal.SIGTERM, 0, 0, 0)
+		except Exception:
+			pass
+else:
+	_worker_preexec = None
+
+def create_process(executable, spec, swap_sigint=True, universal_newlines=True,
+				   stderr=None, read_timeout=30, defer_handshake=False):
 
 	handler = None
 	if swap_sigint:
@@ -32,19 +59,28 @@ def create_process(executable, spec, swap_sigint=True, universal_newlines=True,
 		stdout=subprocess.PIPE,
 		# stderr=subprocess.DEVNULL if stderr is None else stderr,
 		stderr=subprocess.PIPE,
-		bufsize=1 if universal_newlines else -1,
-		universal_newlines=universal_newlines
+		bufsize=1 if universal_newlines else 0,
+		universal_newlines=universal_newlines,
+		preexec_fn=_worker_preexec
 	)
 
 	if swap_sigint:
 		signal.signal(signal.SIGINT, handler)
 
+	if not universal_newlines and isinstance(spec, str):
+		spec = spec.encode()
 	term = '\n' if universal_newlines else b'\n'
 	if not spec.endswith(term):
 		spec += term
 	popen.stdin.write(spec)
 	popen.stdin.flush()
 
+	if defer_handshake:
+		# the caller has already validated this spec against an identical
+		# worker; don't serialize startup waiting for the OK line, let it
+		# be consumed asynchronously from the worker's output stream
+		return True, popen
+
 	try:
 		read_wait([popen.stdout], read_timeout)
 	except TimeoutError:
@@ -68,18 +104,33 @@ def create_process(executable, spec, swap_sigint=True, universal_newlines=True,
 	except TimeoutError:
 		err = traceback.format_exc()
 	else:
-		err = popen.stdout.read() + popen.stderr.read()
+		# a failed worker exits after reporting; wait for it (bounded) so
+		# its pipes hit EOF, then drain non-blockingly--a plain read()
+		# here hangs forever if the worker wedges instead of exiting
+		try:
+			popen.wait(read_timeout)
+		except subprocess.TimeoutExpired:
+			pass
+		err = drain_stream(popen.stdout) + drain_stream(popen.stderr)
+		if universal_newlines:
+			err = err.decode('utf-8', 'replace')
 
 	popen.terminate()
 	return False, err
 
 
+# imported on first StatsCollector construction rather than at module
+# load--runs that never touch analytics skip the psutil import entirely
+psutil = None
+
 if ANALYTICS_ENABLED:
-	import psutil
-	
+
 	class StatsCollector(object):
 
 		def __init__(self):
+			global psutil
+			if psutil is None:
+				import psutil
 			self.data = {}
 			self.counts = {}
 			self.procs = {}
@@ -94,9 +145,9 @@ if ANALYTICS_ENABLED:
 						continue
 
 				except (
-					ProcessLookupError, 
-					psutil._exceptions.AccessDenied,
-					psutil._exceptions.NoSuchProcess
+					ProcessLookupError,
+					psutil.AccessDenied,
+					psutil.NoSuchProcess
 				):
 					continue
 
@@ -117,9 +168,11 @@ if ANALYTICS_ENABLED:
 				proc = self.procs[pid] = psutil.Process(pid)
 				return
 
+			# interval=0 compares against the last sample instead of
+			# sleeping, so a tick never blocks the monitor thread
 			with proc.oneshot():
 				return {
-					'cpus': proc.cpu_percent() / 100.,
+					'cpus': proc.cpu_percent(interval=0) / 100.,
 					'memory': proc.memory_info().rss
 				}
 
@@ -149,13 +202,79 @@ if ANALYTICS_ENABLED:
 
 			return final
 
+class ProcSlot(object):
+	'''
+	Per-worker state bundle: the process, its stdout pipe, the partial-line
+	read buffer, and the number of records currently in flight. One slot
+	per worker keeps every hot-path lookup to a single dict access.
+	'''
+
+	__slots__ = ('proc', 'stdout', 'fd', 'pid', 'buffer', 'inflight',
+				 'handshake', 'stdin_fd', 'outq', 'outoff', 'wpending',
+				 'sent')
+
+	def __init__(self, proc):
+		self.proc = proc
+		self.stdout = proc.stdout
+		self.fd = proc.stdout.fileno()
+		self.pid = proc.pid
+		self.stdin_fd = proc.stdin.fileno()
+		self.buffer = bytearray()
+		self.inflight = 0
+		# True while the worker's deferred OK line is still outstanding
+		self.handshake = False
+		# records queued for this worker but not yet (fully) written to
+		# its stdin pipe, and the byte offset already written of the head
+		self.outq = deque()
+		self.outoff = 0
+		# True while stdin is registered for write readiness
+		self.wpending = False
+		# records fully written to the worker but not yet answered; kept
+		# so a dead worker's batch can be requeued instead of lost
+		self.sent = deque()
+
+class ProcTable(object):
+
+	def __init__(self):
+		self.slots = {}
+
+	def add(self, proc):
+		slot = ProcSlot(proc)
+		self.slots[slot.fd] = slot
+		return slot
+
+	def get(self, fd):
+		return self.slots.get(fd)
+
+	def pop(self, fd):
+		return self.slots.pop(fd, None)
+
+	def clear(self):
+		self.slots.clear()
+
+	def __len__(self):
+		return len(self.slots)
+
+	def __iter__(self):
+		return iter(list(self.slots.values()))
+
 class JobRunner(object):
 
+	# class-level default so the signal wrapper's attribute load always
+	# hits--__init__ shadows it with a per-instance dict
+	signals_recvd = {}
+
 	def __init__(self, spec, data_stream, memory_lim=DEFAULT_MEMORY, logger=logging.getLogger(),
 				 executables=RUNNER_COMMANDS, cpu_lim=DEFAULT_CPU, n_procs=None, maintain=True,
-				 handlers=RUNNER_HANDLERS, process_timeout=30):
+				 handlers=RUNNER_HANDLERS, process_timeout=30, batch_size=DEFAULT_BATCH_SIZE,
+				 binary=False):
 
 		self.spec = spec
+		self.batch_size = max(int(batch_size), 1)
+		# when binary=True, results are yielded as raw bytes lines exactly
+		# as read from the worker pipes--no per-record decode. Used by the
+		# CLI to pass worker output straight through to the output file
+		self.binary = binary
 		self.executables = executables
 		self.handlers = handlers
 		self.memory_lim = memory_lim
@@ -166,22 +285,23 @@ class JobRunner(object):
 		self._n_procs = n_procs
 		self.process_timeout = process_timeout
 
-		self._procs = {}
-		self.streams = {}
+		self.procs = ProcTable()
+		self._pending = deque()
+		# persistent selector--epoll on linux--registered once per worker
+		# rather than rebuilding an fd set every loop() call
+		self.selector = selectors.DefaultSelector()
 		self.exec_type = None
 		self.exec_info = None
 		self.executable = None
 		self.handler = None
-		self.signals_recvd = {}
+		# prewarmed so the signal handler's increment never resizes the dict
+		self.signals_recvd = {signal.SIGINT: 0}
 		if ANALYTICS_ENABLED:
 			self._stats = StatsCollector()
 		else:
 			self._stats = None
-		self._running = False
-		self.attrlocks = {
-			name: threading.Lock() for name
-			in ['_stats', '_procs', '_running']
-		}
+		self.running = False
+		self.attrlocks = {'_stats': threading.Lock()}
 		self.monitor_thread = None
 		self.time_elapsed = 0.
 		self.items_processed = 0
@@ -190,11 +310,10 @@ class JobRunner(object):
 	get_stats, set_stats = locked_attr_funcs('_stats')
 	stats = property(get_stats, set_stats)
 
-	get_procs, set_procs = locked_attr_funcs('_procs')
-	procs = property(get_procs, set_procs)
-
-	get_running, set_running = locked_attr_funcs('_running')
-	running = property(get_running, set_running)
+	# procs and running are deliberately plain attributes: both are only
+	# ever rebound (never structurally shared across threads mid-mutation),
+	# and attribute loads/stores are atomic under the GIL, so routing every
+	# hot-path access through a lock-acquiring property bought nothing
 
 	def n_procs(self):
 		if self._n_procs is not None:
@@ -208,11 +327,44 @@ class JobRunner(object):
 
 		return max(min(m_n_procs, c_n_procs), 1)
 
-	def create_process(self, executable, handler, exec_info):
-		spec_str = json.dumps(exec_info)
+	def create_process(self, executable, handler, exec_info, defer_handshake=False):
+		spec_str = json_dumps(exec_info)
 		executable = executable.copy()
 		executable.append(handler)
-		return create_process(executable, spec_str, read_timeout=self.process_timeout)
+		return create_process(
+			executable, spec_str,
+			universal_newlines=False,
+			read_timeout=self.process_timeout,
+			defer_handshake=defer_handshake
+		)
+
+	def add_proc(self, proc):
+		slot = self.procs.add(proc)
+		# the write side must never block the dispatcher: records that
+		# don't fit in the pipe wait in slot.outq until it drains
+		os.set_blocking(slot.stdin_fd, False)
+		self.selector.register(slot.stdout, selectors.EVENT_READ)
+		return slot
+
+	def remove_proc(self, fn):
+		slot = self.procs.pop(fn)
+		if slot is not None:
+			try:
+				self.selector.unregister(slot.stdout)
+			except KeyError:
+				pass
+			if slot.wpending:
+				try:
+					self.selector.unregister(slot.proc.stdin)
+				except KeyError:
+					pass
+				slot.wpending = False
+		return slot
+
+	def clear_procs(self):
+		for slot in self.procs:
+			self.remove_proc(slot.fd)
+		self.procs.clear()
 
 	def kill_process(self, proc, soft=True, wait=False):
 		if soft:
@@ -268,43 +420,83 @@ class JobRunner(object):
 				'when': 'getting exec_info'
 			}
 
-		all_success = True
-		err = None
 		self.logger.debug('creating %d processes', n_procs)
 		self.logger.debug('executable: %s', self.executable)
 		self.logger.debug('handler: %s', self.handler)
+		# spawn everything back to back with handshakes deferred, then
+		# validate the spec against whichever worker responds first; the
+		# remaining OK lines are absorbed by handle_stream as they arrive
 		for _ in range(n_procs):
-			success, proc = self.create_process(
-				self.executable, 
-				self.handler, 
-				self.exec_info
+			_, proc = self.create_process(
+				self.executable,
+				self.handler,
+				self.exec_info,
+				defer_handshake=True
 			)
-			if not success:
-				all_success = False
-				try:
-					proc = json.loads(proc)
-				except:
-					err = {
-						'stack': proc,
-						'when': 'decoding error (raw provided)'
-					}
-				break
-
 			self.logger.debug('created %d', proc.pid)
-			fn = proc.stdout.fileno()
-			self.procs[fn] = proc
-			self.streams[fn] = proc.stdout
+			self.add_proc(proc).handshake = True
 
-		if not all_success:
+		success, err = self.wait_handshake()
+		if not success:
 			self.terminate(soft=False)
-			self.procs, self.streams = {}, {}
+			self.clear_procs()
 			return False, err
 
 		return True, None
 
+	def wait_handshake(self):
+		slots = list(self.procs)
+		if not slots:
+			return True, None
+
+		streams = [slot.stdout for slot in slots]
+		try:
+			ready = read_wait(streams, self.process_timeout, min_ready=1)
+		except TimeoutError:
+			return False, {
+				'stack': traceback.format_exc(),
+				'when': 'waiting for worker handshake'
+			}
+
+		stream = ready[0]
+		slot = self.procs.get(stream.fileno())
+		line = stream.readline()
+		slot.handshake = False
+		if line.strip().upper() == b'OK':
+			return True, None
+
+		# the worker reported a validation failure--collect its error
+		# output. It exits after reporting, so wait (bounded) for EOF and
+		# drain non-blockingly; blocking read() would hang on a wedged
+		# worker that never closes its pipes
+		try:
+			read_wait([stream, slot.proc.stderr], self.process_timeout)
+			try:
+				slot.proc.wait(self.process_timeout)
+			except subprocess.TimeoutExpired:
+				pass
+			raw = drain_stream(stream) + drain_stream(slot.proc.stderr)
+		except ALWAYS_RAISE:
+			raise
+		except:
+			raw = traceback.format_exc()
+
+		try:
+			err = json.loads(raw)
+		except ALWAYS_RAISE:
+			raise
+		except:
+			if isinstance(raw, bytes):
+				raw = raw.decode('utf-8', 'replace')
+			err = {
+				'stack': raw,
+				'when': 'decoding error (raw provided)'
+			}
+		return False, err
+
 	def terminate(self, soft=True, wait=False):
-		for proc in self.procs.values():
-			self.kill_process(proc, soft=soft, wait=wait)
+		for slot in self.procs:
+			self.kill_process(slot.proc, soft=soft, wait=wait)
 
 	@signal_handler
 	def handle_sigint(self, signum, frame):
@@ -320,94 +512,207 @@ class JobRunner(object):
 		raise KeyboardInterrupt
 
 	def handle_stream(self, stream):
-		out = stream.readline()
 		fn = stream.fileno()
-		proc = self.procs[fn]
-		if not self.seed(proc.stdin):
-			proc.stdin.close()
-			self.kill_process(proc, soft=False, wait=True)
-			del self.procs[fn], self.streams[fn]
+		slot = self.procs.get(fn)
+		chunk = os.read(fn, PIPE_CHUNK)
+		if not chunk:
+			raise BrokenPipeError('worker closed its output pipe')
+		tail = slot.buffer
+		tail += chunk
+		if b'\n' not in tail:
+			return []
+		lines = tail.split(b'\n')
+		slot.buffer = bytearray(lines.pop())
+		if slot.handshake and lines:
+			hs = lines.pop(0)
+			slot.handshake = False
+			if hs.strip().upper() != b'OK':
+				# the spec validated against an identical worker, so this
+				# one failing is unexpected--treat it like a dead worker
+				raise BrokenPipeError('worker failed deferred handshake')
+		# the split pieces are bytearrays (views of the tail buffer); hand
+		# consumers real bytes, which are hashable and immutable
+		out = [bytes(line) + b'\n' for line in lines]
+		# each result line acknowledges the oldest sent record
+		sent = slot.sent
+		for _ in range(min(len(lines), len(sent))):
+			sent.popleft()
+		slot.inflight -= len(lines)
+		seeded = self.seed(slot, len(lines))
+		slot.inflight += seeded
+		if not seeded and slot.inflight <= 0 and not slot.outq:
+			slot.proc.stdin.close()
+			self.kill_process(slot.proc, soft=False, wait=True)
+			self.remove_proc(fn)
 		return out
 
 	def handle_broken_stream(self, stream):
 		fn = stream.fileno()
-		proc = self.procs[fn]
-		self.kill_process(proc, soft=False, wait=True)
-		del self.procs[fn], self.streams[fn]
+		slot = self.procs.get(fn)
+		leftovers = []
+		if slot is not None:
+			self.kill_process(slot.proc, soft=False, wait=True)
+			# death may have been noticed on the write side (EPIPE while
+			# seeding) with finished results still sitting unread in the
+			# stdout pipe--collect them before writing the batch off
+			try:
+				data = drain_stream(slot.stdout)
+			except (OSError, ValueError):
+				data = b''
+			self.remove_proc(fn)
+			lines = bytes(slot.buffer + data).split(b'\n')
+			lines.pop()
+			if slot.handshake and lines and lines[0].strip().upper() == b'OK':
+				lines.pop(0)
+			sent = slot.sent
+			for _ in range(min(len(lines), len(sent))):
+				sent.popleft()
+			leftovers = [line + b'\n' for line in lines if line.strip()]
+			if sent:
+				# the head of the sent queue is the record the worker was
+				# processing when it died; requeueing it would likely just
+				# crash the replacement too, so it is dropped--the same
+				# at-most-one-record loss as unbatched operation--and the
+				# rest of the batch is retried on another worker
+				sent.popleft()
+				self.logger.warning(
+					'worker %d died mid-record; dropped the record it was '
+					'processing and requeued %d unacknowledged record(s)',
+					slot.pid, len(sent) + len(slot.outq))
+			slot.outoff = 0
+			requeue = list(sent) + list(slot.outq)
+			if requeue:
+				self._pending.extendleft(reversed(requeue))
+			sent.clear()
+			slot.outq.clear()
 		if self.signals_recvd.get(signal.SIGINT, 0) > 0 or not self.create:
-			return
+			return leftovers
 		self.logger.debug('process died. creating new')
 		success, proc = self.create_process(self.executable, self.handler, self.exec_info)
 		self.logger.debug('created')
 		if success:
-			if self.seed(proc.stdin):
-				fn = proc.stdout.fileno()
-				self.procs[fn] = proc
-				self.streams[fn] = proc.stdout
+			new_slot = self.add_proc(proc)
+			seeded = self.seed(new_slot, self.batch_size)
+			if seeded:
+				new_slot.inflight = seeded
 			else:
 				self.kill_process(proc, soft=False, wait=True)
+				self.remove_proc(new_slot.fd)
 		else:
 			self.create = False
-
-	def write_line(self, stream, item):
-		term = '\n' if isinstance(item, str) else b'\n'
-		if not item.endswith(term):
-			item += term
-		stream.write(item)
-		stream.flush()
+		return leftovers
 
 	def loop(self, timeout=None):
-		waiters = list(self.streams.values())
-		if len(waiters) == 0:
+		if len(self.procs) == 0:
 			raise IterationCompleted()
 
-		ready, _, _ = select.select(waiters, [], [], timeout)
-		for stream in ready:
+		binary = self.binary
+		for key, mask in self.selector.select(timeout):
+			if mask & selectors.EVENT_WRITE:
+				slot = key.data
+				# the slot may have been torn down by an earlier event in
+				# this same batch
+				if self.procs.get(slot.fd) is not slot:
+					continue
+				try:
+					self.flush_stdin(slot)
+				except BrokenPipeError:
+					for item in self.handle_broken_stream(slot.stdout):
+						yield item if binary else item.decode()
+				continue
+			stream = key.fileobj
 			try:
-				item = self.handle_stream(stream)
-				if item:
-					yield item
+				for item in self.handle_stream(stream):
+					if item.strip():
+						yield item if binary else item.decode()
 			except BrokenPipeError:
-				self.handle_broken_stream(stream)
+				for item in self.handle_broken_stream(stream):
+					yield item if binary else item.decode()
 
 
-	def seed(self, stream):
-		try:
-			val = next(self.data_stream)
-		except StopIteration:
-			return False
-		else:
+	def flush_stdin(self, slot):
+		q = slot.outq
+		if q:
+			bufs = list(q)
+			if slot.outoff:
+				bufs[0] = memoryview(bufs[0])[slot.outoff:]
 			try:
-				self.write_line(stream, val)
-			except:
-				self.data_stream = chain([val], self.data_stream)
-				raise
-			return True
+				# one writev() regardless of how many records are queued;
+				# O_NONBLOCK means a full pipe returns instead of wedging
+				# the dispatcher while the worker waits to be drained
+				written = os.writev(slot.stdin_fd, bufs)
+			except BlockingIOError:
+				written = 0
+			# writev reports bytes, not buffers--retire fully-written
+			# records and track the offset into a partially-written head
+			# so an interrupted write never truncates or resends a record
+			while written and q:
+				head_left = len(q[0]) - slot.outoff
+				if written >= head_left:
+					written -= head_left
+					slot.sent.append(q.popleft())
+					slot.outoff = 0
+				else:
+					slot.outoff += written
+					written = 0
+
+		if q and not slot.wpending:
+			self.selector.register(slot.proc.stdin, selectors.EVENT_WRITE, slot)
+			slot.wpending = True
+		elif not q and slot.wpending:
+			self.selector.unregister(slot.proc.stdin)
+			slot.wpending = False
+
+	def seed(self, slot, n=1):
+		count = 0
+		while count < n:
+			if self._pending:
+				val = self._pending.popleft()
+			else:
+				try:
+					val = next(self.data_stream)
+				except StopIteration:
+					break
+			if isinstance(val, str):
+				val = val.encode()
+			if not val.endswith(b'\n'):
+				val += b'\n'
+			slot.outq.append(val)
+			count += 1
+
+		if count:
+			self.flush_stdin(slot)
+		return count
 
 	def seed_procs(self):
-		vals = list(self.procs.values())
+		slots = list(self.procs)
 		max_ind = -1
-		for ind, proc in enumerate(self.procs.values()):
-			self.logger.debug('seeding %d' % proc.pid)
-			if not self.seed(proc.stdin):
+		for ind, slot in enumerate(slots):
+			self.logger.debug('seeding %d' % slot.pid)
+			seeded = self.seed(slot, self.batch_size)
+			if not seeded:
 				break
+			slot.inflight = seeded
 			max_ind = ind
 
 		# delete unneeded processes
-		remaining = len(vals) - max_ind - 1
+		remaining = len(slots) - max_ind - 1
 		if remaining > 0:
 			self.logger.debug('deleting %d processe(s)', remaining)
-			for proc in vals[-remaining:]:
-				fn = proc.stdout.fileno()
-				self.kill_process(proc, soft=False, wait=True)
-				del self.procs[fn], self.streams[fn]
+			for slot in slots[-remaining:]:
+				self.kill_process(slot.proc, soft=False, wait=True)
+				self.remove_proc(slot.fd)
 
 	def update_stats(self):
-		procs = [v.pid for v in self.procs.values() if not v.returncode]
-		self.stats.update(procs)
+		# runs on the monitor thread--read the underlying attributes
+		# directly rather than taking the property locks every tick,
+		# which contends with the dispatcher loop. Rebinding is atomic
+		# under the GIL, so a torn read is not possible
+		procs = [slot.pid for slot in self.procs if not slot.proc.returncode]
+		self._stats.update(procs)
 
 	def monitor(self, interval=0.1):
-		if self.stats is None:
+		if self._stats is None:
 			return
 		try:
 			while self.running:
@@ -469,7 +774,7 @@ class JobRunner(object):
 			yield self.gen(beg, timeout)
 		finally:
 			self.terminate(soft=False, wait=True)
-			self.procs, self.streams = {}, {}
+			self.clear_procs()
 
 			self.time_elapsed = time.time() - beg
 			if swap_sigint:
@@ -1,47 +1,53 @@
 from . import handlers
+import importlib.util
 import inspect
 import multiprocessing as mp
 import os
 import subprocess
 import sys
-from .utils import python2_cmd, python3_cmd, node_cmd
+from .utils import find_interpreters
 
-try:
-	import psutil
-	ANALYTICS_ENABLED = True
-except ImportError:
-	ANALYTICS_ENABLED = False
-
-try:
-	import yaml
-	YAML_ENABLED = True
-except ImportError:
-	YAML_ENABLED = False
+# feature flags via find_spec--checking for the optional dependencies
+# without importing them keeps their cost off CLI startup; the modules
+# are imported lazily at the call sites that actually use them
+ANALYTICS_ENABLED = importlib.util.find_spec('psutil') is not None
+YAML_ENABLED = importlib.util.find_spec('yaml') is not None
+ORJSON_ENABLED = importlib.util.find_spec('orjson') is not None
 
 _major = sys.version_info.major
 
 DEFAULT_CPU = mp.cpu_count()
 
-if ANALYTICS_ENABLED:
-	DEFAULT_MEMORY = psutil.virtual_memory().total * .9
-else:
-	try:
-		DEFAULT_MEMORY = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
-	except ValueError:
-		# Not even used in the current implementation (n_procs always passed), so 
-		# just estimate this if we can't find it w/ the two ways above, no need to
-		# raise an error (estimating 2gb mem/core)
-		DEFAULT_MEMORY = DEFAULT_CPU * 2 * 1024 ** 3
+try:
+	DEFAULT_MEMORY = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+except (ValueError, AttributeError, OSError):
+	# Not even used in the current implementation (n_procs always passed), so
+	# just estimate this if we can't find it w/ sysconf, no need to
+	# raise an error (estimating 2gb mem/core)
+	DEFAULT_MEMORY = DEFAULT_CPU * 2 * 1024 ** 3
 
 HANDLERS_DIR = os.path.dirname(inspect.getfile(handlers))
 
+# number of records kept in flight per worker; amortizes pipe round-trip
+# latency for fast handlers without unbounded buffering for slow ones
+DEFAULT_BATCH_SIZE = 16
+
 ALWAYS_RAISE = (KeyboardInterrupt, SystemExit)
 
-PYTHON2_CMD = python2_cmd()
-PYTHON3_CMD = python3_cmd()
+# batch discovery: every interpreter not answered by sys.executable is
+# resolved in a single shared PATH walk with one cache round-trip
+_specs = {'node': ('node', ('node.js', 'node'))}
+if _major != 2:
+	_specs['python2'] = ('python', ('python2', 'python'))
+if _major != 3:
+	_specs['python3'] = ('python3', ('python3', 'python'))
+_interps = find_interpreters(_specs)
+
+PYTHON2_CMD = sys.executable if _major == 2 else _interps['python2']
+PYTHON3_CMD = sys.executable if _major == 3 else _interps['python3']
 PYTHON_CMD = PYTHON3_CMD if _major == 3 else PYTHON2_CMD
 
-NODE_CMD = node_cmd()
+NODE_CMD = _interps['node']
 
 RUNNER_HANDLERS = {
 	'python2': os.path.join(HANDLERS_DIR, 'python.py'),
@@ -1,50 +1,118 @@
-from functools import wraps
-import select
-import subprocess
+from functools import lru_cache, wraps
+import hashlib
+import json
+import os
+import selectors
+import shutil
 import sys
+import tempfile
 import time
 
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'multirunner')
+
 class IterationCompleted(Exception):
 	pass
 
 def read_wait(streams, timeout=None, min_ready=None):
-	streams = list(streams)
+	streams = set(streams)
+	n = len(streams)
 	if min_ready is None:
-		min_ready = len(streams)
+		min_ready = n
 
-	done_streams = []
-	beg = time.time()
-	while True:
-		if timeout is None:
-			to = None
-		else:
-			to = timeout - (time.time() - beg)
-			if to < 0:
-				raise TimeoutError('an insufficient quantity of streams buffered in time')
+	# result list preallocated to the known upper bound; index writes
+	# instead of append avoid list-growth reallocations while collecting
+	done_streams = [None] * n
+	idx = 0
+	# epoll/kqueue via selectors: register each stream once and get back
+	# only the ready ones, instead of handing select() the full fd set on
+	# every iteration
+	sel = selectors.DefaultSelector()
+	try:
+		for stream in streams:
+			sel.register(stream, selectors.EVENT_READ)
+
+		select = sel.select
+		unregister = sel.unregister
+
+		# monotonic deadline--wall-clock jumps (NTP and the like) must not
+		# produce spurious timeouts or hangs
+		deadline = None if timeout is None else time.monotonic() + timeout
+		while True:
+			if deadline is None:
+				to = None
+			else:
+				to = deadline - time.monotonic()
+				if to < 0:
+					raise TimeoutError('an insufficient quantity of streams buffered in time')
+
+			for key, _ in select(to):
+				unregister(key.fileobj)
+				done_streams[idx] = key.fileobj
+				idx += 1
 
-		done, _, _ = select.select(streams, [], [], to)
-		for val in done:
-			streams.remove(val)
-		done_streams.extend(done)
+			if idx >= min_ready or idx == n:
+				del done_streams[idx:]
+				return done_streams
+	finally:
+		sel.close()
 
-		if len(done_streams) >= min_ready or len(streams) == 0:
-			return done_streams
+def drain_stream(stream, chunk=65536):
+	'''
+	Pull everything a pipe currently holds without blocking for EOF,
+	returning bytes whether the stream is text or binary mode. A plain
+	read() on a live pipe waits for the writer to close its end; reads
+	here come straight off the fd with os.read under O_NONBLOCK, after
+	collecting whatever the python-level wrapper already buffered (those
+	bytes never reappear on the fd).
+	'''
+	fd = stream.fileno()
+	blocking = os.get_blocking(fd)
+	if blocking:
+		os.set_blocking(fd, False)
+	buf = bytearray()
+	try:
+		# text streams expose their byte buffer as .buffer; peek returns
+		# the buffered bytes without issuing a blocking raw read now that
+		# the fd is non-blocking
+		buffered = getattr(stream, 'buffer', stream)
+		peek = getattr(buffered, 'peek', None)
+		if peek is not None:
+			try:
+				buf += peek()
+			except (OSError, ValueError):
+				pass
+		while True:
+			try:
+				data = os.read(fd, chunk)
+			except BlockingIOError:
+				break
+			if not data:
+				break
+			buf += data
+	finally:
+		if blocking:
+			os.set_blocking(fd, True)
+	return bytes(buf)
 
 def signal_handler(func):
 	@wraps(func)
 	def handler(self, signum, frame, store=True):
+		# runs in signal-delivery context: a plain attribute load and one
+		# dict update, no locks and no existence probing--classes using
+		# this decorator define signals_recvd at class level
 		if store:
-			if not hasattr(self, 'signals_recvd'):
-				self.signals_recvd = {}
-			self.signals_recvd.setdefault(signum, 0)
-			self.signals_recvd[signum] += 1
+			counts = self.signals_recvd
+			counts[signum] = counts.get(signum, 0) + 1
 		return func(self, signum, frame)
 	return handler
 
 def locked_attr_funcs(attr):
 	def _get(self):
-		with self.attrlocks[attr]:
-			return getattr(self, attr)
+		# attribute loads are atomic under the GIL, so reads skip the lock
+		# entirely--a reader sees either the old or the new reference, never
+		# a torn value. Writes stay serialized so compound updates by
+		# multiple writers can't interleave.
+		return getattr(self, attr)
 
 	def _set(self, val):
 		with self.attrlocks[attr]:
@@ -55,42 +123,153 @@ def locked_attr_funcs(attr):
 
 	return _get, _set
 
-def command_exists(cmd, shell=False):
-	wcmd = ['which']
-	if shell:
-		wcmd = subprocess.list2cmdline(wcmd)
-		wcmd = '{} {}'.format(wcmd, cmd)
-	else:
-		if isinstance(cmd, str):
-			cmd = [cmd]
-		wcmd.extend(cmd)
-	proc = subprocess.Popen(
-		wcmd, 
-		stdout=subprocess.PIPE, 
-		stderr=subprocess.DEVNULL, 
-		shell=shell
-	)
-	out, _ = proc.communicate()
-	return bool(out)
+@lru_cache(maxsize=256)
+def _command_exists(cmd):
+	# no subprocess is spawned here at all anymore--probing stays
+	# in-process, which beats even a vfork-based spawn of which
+	return shutil.which(cmd) is not None
+
+def command_exists(cmd):
+	'''
+	Check whether cmd resolves on PATH. This used to shell out to which;
+	shutil.which does the same walk in-process for a few stat() calls
+	instead of a fork+exec. cmd may be a command list, in which case the
+	executable (first element) is checked.
+	'''
+	if isinstance(cmd, (list, tuple)):
+		cmd = cmd[0] if cmd else ''
+	return bool(cmd) and _command_exists(cmd)
+
+def commands_exist(cmds):
+	'''
+	Probe several commands with a single PATH walk, instead of one full
+	shutil.which scan per candidate. Returns the subset of cmds found.
+	'''
+	pending = set(cmds)
+	found = set()
+	seen = set()
+	for d in os.environ.get('PATH', os.defpath).split(os.pathsep):
+		if not d or d in seen:
+			continue
+		seen.add(d)
+		for cmd in list(pending):
+			path = os.path.join(d, cmd)
+			if os.path.isfile(path) and os.access(path, os.X_OK):
+				pending.discard(cmd)
+				found.add(cmd)
+		if not pending:
+			break
+	return found
+
+_interp_cache = None
+
+def interp_cache_path():
+	# keyed by $PATH plus the mtimes of its directories, so both a changed
+	# PATH and a newly installed (or removed) binary in an existing entry
+	# invalidate the cache--stale results just age out as unused files
+	key = hashlib.md5(os.environ.get('PATH', '').encode())
+	for d in os.environ.get('PATH', os.defpath).split(os.pathsep):
+		try:
+			key.update(b'%d' % os.stat(d).st_mtime_ns)
+		except OSError:
+			pass
+	return os.path.join(CACHE_DIR, 'interpreters.%s.json' % key.hexdigest()[:12])
+
+def load_interp_cache():
+	global _interp_cache
+	if _interp_cache is None:
+		try:
+			with open(interp_cache_path()) as f:
+				_interp_cache = json.load(f)
+			assert isinstance(_interp_cache, dict)
+		except (KeyboardInterrupt, SystemExit):
+			raise
+		except:
+			_interp_cache = {}
+	return _interp_cache
+
+def save_interp_cache(cache):
+	# best-effort--the probes just run again next time if this fails
+	try:
+		os.makedirs(CACHE_DIR, exist_ok=True)
+		fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix='.json')
+		with os.fdopen(fd, 'w') as f:
+			json.dump(cache, f)
+		os.replace(tmp, interp_cache_path())
+	except (KeyboardInterrupt, SystemExit):
+		raise
+	except:
+		pass
 
 def cmd_finder(default, ops):
-	def func(default=default, ops=ops):
+	def func():
+		# probing commands is pure startup overhead for a CLI that runs
+		# often--results are cached on disk keyed by a hash of $PATH, so
+		# a changed PATH gets fresh probes and an unchanged one gets none
+		key = '%s:%s' % (default, ','.join(ops))
+		cache = load_interp_cache()
+		if key in cache:
+			return cache[key]
+
+		found = default
+		present = commands_exist(ops)
 		for op in ops:
-			if command_exists(op):
-				return op
-		return default
+			if op in present:
+				found = op
+				break
+
+		cache[key] = found
+		save_interp_cache(cache)
+		return found
 	return func
 
-def python2_cmd(default='python', ops=['python2', 'python']):
-	if sys.version_info.major == 2:
-		return sys.executable
+def find_interpreters(specs):
+	'''
+	Resolve several interpreter commands at once. specs maps a name to a
+	(default, ops) pair; the candidates of every uncached entry are probed
+	with one shared PATH walk, and the cache is written back once, instead
+	of one walk and one cache round-trip per interpreter.
+	'''
+	cache = load_interp_cache()
+	out = {}
+	missing = {}
+	for name, (default, ops) in specs.items():
+		key = '%s:%s' % (default, ','.join(ops))
+		if key in cache:
+			out[name] = cache[key]
+		else:
+			missing[name] = (key, default, ops)
+
+	if missing:
+		all_ops = set()
+		for _, _, ops in missing.values():
+			all_ops.update(ops)
+		present = commands_exist(all_ops)
+
+		for name, (key, default, ops) in missing.items():
+			found = default
+			for op in ops:
+				if op in present:
+					found = op
+					break
+			cache[key] = found
+			out[name] = found
+		save_interp_cache(cache)
 
-	return cmd_finder(default, ops)(default, ops)
+	return out
 
-def python3_cmd(default='python3', ops=['python3', 'python']):
-	if sys.version_info.major == 3:
+def _interp_cmd(major, default, ops):
+	# when the probe target is this very interpreter, skip discovery
+	# altogether--sys.executable is already the answer
+	if sys.version_info.major == major:
 		return sys.executable
 
-	return cmd_finder(default, ops)(default, ops)
+	return cmd_finder(default, ops)()
+
+def python2_cmd(default='python', ops=('python2', 'python')):
+	return _interp_cmd(2, default, ops)
+
+def python3_cmd(default='python3', ops=('python3', 'python')):
+	return _interp_cmd(3, default, ops)
 
-node_cmd = cmd_finder('node', ['node.js', 'node'])
\ No newline at end of file
+node_cmd = cmd_finder('node', ('node.js', 'node'))
\ No newline at end of file